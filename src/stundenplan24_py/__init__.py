@@ -1,9 +1,52 @@
-from .client import *
+from __future__ import annotations
+
+import importlib
+import typing
+
 from .shared import *
 from .endpoints import *
 from .errors import *
+from . import shared, endpoints, errors
+
+if typing.TYPE_CHECKING:
+    from .client import *
+    from . import (
+        indiware_mobil,
+        substitution_plan,
+    )
+
+# the clients pull in requests and urllib3, so they are only imported on first access
+_LAZY_ATTRIBUTES = {
+    "Credentials": "client",
+    "Hosting": "client",
+    "PlanResponse": "client",
+    "CircuitBreaker": "client",
+    "PlanClient": "client",
+    "IndiwareMobilClient": "client",
+    "SubstitutionPlanClient": "client",
+    "IndiwareStundenplanerClient": "client",
+}
+_LAZY_MODULES = ("client", "indiware_mobil", "substitution_plan", "proxies")
+
+__all__ = [
+    *shared.__all__,
+    *endpoints.__all__,
+    *(name for name in vars(errors) if name.endswith("Error")),
+    *_LAZY_ATTRIBUTES,
+    "indiware_mobil",
+    "substitution_plan",
+]
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__), name)
+
+    if name in _LAZY_MODULES:
+        return importlib.import_module(f".{name}", __name__)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-from . import (
-    indiware_mobil,
-    substitution_plan,
-)
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES) | set(_LAZY_MODULES))
@@ -1,24 +1,34 @@
 from __future__ import annotations
 
 import abc
+import collections
 import concurrent.futures
 import dataclasses
 import datetime
 import http.client
 import urllib.parse
 import email.utils
+import functools
+import itertools
+import os
+import time
 import typing
 import asyncio
 import logging
 
+import requests.adapters
 import requests.auth
 import urllib3.fields
 import urllib3.exceptions
 import urllib3.connection
 
 from .endpoints import *
-from .errors import PlanClientError, PlanNotFoundError, UnauthorizedError, NotModifiedError
-from . import proxies
+from .errors import (
+    PlanClientError, PlanNotFoundError, UnauthorizedError, NotModifiedError, NoProxyAvailableError, CircuitOpenError
+)
+
+if typing.TYPE_CHECKING:
+    from . import proxies
 
 logging.getLogger("urllib3").setLevel(logging.CRITICAL)
 logging.getLogger("urllib3").propagate = False
@@ -29,6 +39,7 @@ __all__ = [
     "Credentials",
     "Hosting",
     "PlanResponse",
+    "CircuitBreaker",
     "PlanClient",
     "IndiwareMobilClient",
     "SubstitutionPlanClient",
@@ -36,7 +47,15 @@ __all__ = [
 ]
 
 _DELAY_BETWEEN_REQUESTS = 0
-REQUEST_LOCK = asyncio.Lock()
+
+# never mutated, requests merges it into a new dict
+_BASE_HEADERS = {"User-Agent": "Indiware"}
+
+# shared by all clients so that we don't spawn a new pool of threads per client
+_REQUEST_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get("SP24_THREAD_POOL_SIZE", 32)),
+    thread_name_prefix="stundenplan24_py"
+)
 
 
 def set_min_delay_between_requests(delay_seconds: float):
@@ -48,13 +67,74 @@ def get_min_delay_between_requests() -> float:
     return _DELAY_BETWEEN_REQUESTS
 
 
-@dataclasses.dataclass
+class _RequestThrottle:
+    """Spaces out the start of requests by the minimum delay without serializing the requests themselves."""
+
+    def __init__(self):
+        self._next_allowed = 0.0
+
+    async def wait(self):
+        # no await between reading and updating _next_allowed, so no lock is needed
+        now = time.monotonic()
+        delay = max(0.0, self._next_allowed - now)
+        self._next_allowed = max(self._next_allowed, now) + _DELAY_BETWEEN_REQUESTS
+
+        if delay:
+            await asyncio.sleep(delay)
+
+
+# requests to different hosts don't have to wait for each other
+_HOST_THROTTLES: dict[str, _RequestThrottle] = {}
+
+
+def _get_host_throttle(host: str) -> _RequestThrottle:
+    try:
+        return _HOST_THROTTLES[host]
+    except KeyError:
+        return _HOST_THROTTLES.setdefault(host, _RequestThrottle())
+
+
+class CircuitBreaker:
+    """Fails requests to an endpoint fast after it failed repeatedly, instead of waiting for every request (and
+    every proxy) to time out. Opt-in per client, pass the same instance to clients of one endpoint to share it."""
+
+    def __init__(self, trip_threshold: int = 5, reset_timeout: float = 30):
+        self.trip_threshold = trip_threshold
+        self.reset_timeout = reset_timeout
+
+        self._failures = 0
+        self._opened_at: float | None = None
+
+    def allow_request(self) -> bool:
+        if self._opened_at is None:
+            return True
+
+        now = time.monotonic()
+        if now - self._opened_at < self.reset_timeout:
+            return False
+
+        # half open: this request probes the host, everyone else keeps failing fast until it succeeds
+        self._opened_at = now
+        return True
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        self._failures += 1
+
+        if self._failures >= self.trip_threshold:
+            self._opened_at = time.monotonic()
+
+
+@dataclasses.dataclass(slots=True)
 class Credentials:
     username: str
     password: str
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Hosting:
     creds: Credentials
 
@@ -100,17 +180,45 @@ class PlanResponse:
     response: requests.Response
 
     @property
+    def raw_content(self) -> bytes:
+        """The undecoded body, XML parsers can read it directly and honor the declared encoding."""
+        return self.response.content
+
+    @functools.cached_property
     def last_modified(self) -> datetime.datetime | None:
         if "Last-Modified" in self.response.headers:
             return email.utils.parsedate_to_datetime(self.response.headers["Last-Modified"])
         else:
             return None
 
-    @property
+    @functools.cached_property
     def etag(self) -> str | None:
         return self.response.headers.get("ETag", None)
 
 
+def _is_known_proxy_connection_error(e: requests.ConnectionError, proxy: proxies.Proxy) -> bool:
+    """Whether e is one of the connection errors that are expected when a proxy is unreachable or flaky."""
+
+    if len(e.args) != 1:
+        return False
+    reason, = e.args
+
+    # timed out connecting to the proxy itself
+    if isinstance(e, requests.ConnectTimeout) and isinstance(reason, urllib3.exceptions.MaxRetryError):
+        timeout_error = reason.reason
+        if isinstance(timeout_error, urllib3.exceptions.ConnectTimeoutError) and len(timeout_error.args) == 2:
+            connection = timeout_error.args[0]
+            if isinstance(connection, urllib3.connection.HTTPSConnection) and connection.host == proxy.url:
+                return True
+
+    # the proxy dropped the connection
+    return (
+        isinstance(reason, urllib3.exceptions.ProtocolError)
+        and len(reason.args) == 2
+        and isinstance(reason.args[1], (http.client.RemoteDisconnected, ConnectionResetError))
+    )
+
+
 def _do_request(session, request_kwargs, proxy_url):
     return session.request(
         **request_kwargs,
@@ -125,121 +233,224 @@ def _do_request(session, request_kwargs, proxy_url):
 class PlanClientRequestContextManager:
     def __init__(self, session: requests.Session, request_kwargs: dict[str, typing.Any],
                  request_executor: concurrent.futures.Executor, no_delay: bool = False,
-                 proxy_provider: proxies.ProxyProvider | None = None):
+                 proxy_provider: proxies.ProxyProvider | None = None,
+                 response_cache: _ResponseCache | None = None,
+                 cached_response: requests.Response | None = None,
+                 inflight: dict[asyncio.Future, concurrent.futures.Future] | None = None,
+                 circuit_breaker: CircuitBreaker | None = None):
         self.session = session
         self.request_kwargs = request_kwargs
         self.no_delay = no_delay
         self.proxy_provider = proxy_provider
         self.request_executor = request_executor
+        self.response_cache = response_cache
+        # response whose validators were sent with this request, returned if the server answers 304
+        self.cached_response = cached_response
+        self.host = urllib.parse.urlsplit(request_kwargs["url"]).netloc
+        # pending requests of the client, so that closing the client can cancel them
+        self.inflight = inflight
+        self.circuit_breaker = circuit_breaker
 
     async def __aenter__(self):
+        return await self._request()
+
+    async def _request(self) -> requests.Response:
+        circuit_breaker = self.circuit_breaker
+        if circuit_breaker is not None and not circuit_breaker.allow_request():
+            raise CircuitOpenError(
+                f"Too many failed requests to this endpoint, not requesting {self.request_kwargs['url']!r} for now.", None
+            )
+
         if not self.no_delay:
-            await REQUEST_LOCK.acquire()
+            await _get_host_throttle(self.host).wait()
 
         try:
-            _num_proxy_tries = 0
-
-            for proxy in self.proxy_provider.iterate_proxies() if self.proxy_provider is not None else [None]:
-                _num_proxy_tries += 1
-
-                proxy_url = str(urllib3.util.Url(
-                    host=proxy.url,
-                    auth=f"{proxy.auth.login}:{proxy.auth.password}" if proxy.auth is not None else None,
-                    port=proxy.port,
-                    scheme="http"
-                )) if proxy is not None else None
-
-                try:
-                    response = await asyncio.get_running_loop().run_in_executor(
-                        self.request_executor,
-                        _do_request, self.session, self.request_kwargs, proxy_url
-                    )
-                except (TimeoutError, requests.exceptions.ReadTimeout, requests.exceptions.ProxyError,
-                        requests.exceptions.SSLError, urllib3.exceptions.ConnectTimeoutError):
-                    if self.proxy_provider:
-                        self.proxy_provider.mark_broken(proxy)
-                        continue
-                    else:
-                        raise
-                except requests.ConnectionError as e:
-                    if not self.proxy_provider:
-                        raise
-                    match e:
-                        # @formatter:off
-                        case (
-                            requests.ConnectTimeout(
-                                args=(urllib3.exceptions.MaxRetryError(
-                                    reason=urllib3.exceptions.ConnectTimeoutError(
-                                        args=(urllib3.connection.HTTPSConnection(host=proxy.url), _))), ))
-                        ):
-                            # @formatter:on
-                            self.proxy_provider.mark_broken(proxy)
-                            continue
-                        # @formatter:off
-                        case (
-                            requests.ConnectionError(
-                                args=(urllib3.exceptions.ProtocolError(
-                                    args=(_, http.client.RemoteDisconnected())),))
-                        ):
-                            # @formatter:on
-                            self.proxy_provider.mark_broken(proxy)
-                            continue
-                        case (
-                            requests.ConnectionError(
-                                args=(urllib3.exceptions.ProtocolError(
-                                    args=(_, ConnectionResetError())), ))
-                        ):
-                            # @formatter:on
-                            self.proxy_provider.mark_broken(proxy)
-                            continue
-                        case _:
-                            self.proxy_provider.mark_broken(proxy)
-                            logging.error("Unhandled requests.ConnectionError.", exc_info=e)
-
+            response, _num_proxy_tries = await self._send()
+        except (requests.RequestException, TimeoutError, urllib3.exceptions.HTTPError, NoProxyAvailableError):
+            if circuit_breaker is not None:
+                circuit_breaker.record_failure()
+            raise
+
+        if circuit_breaker is not None:
+            if response.status_code >= 500:
+                circuit_breaker.record_failure()
+            else:
+                circuit_breaker.record_success()
+
+        if response.status_code == 401:
+            raise UnauthorizedError(f"Invalid credentials for request to {response.url!r}.",
+                                    response.status_code)
+        elif response.status_code == 304:
+            if self.cached_response is not None:
+                self.cached_response._num_proxy_tries = _num_proxy_tries
+                return self.cached_response
+
+            raise NotModifiedError(
+                f"The requested ressource at {response.url!r} has not been modified since.",
+                response.status_code)
+
+        response.encoding = "utf-8"  # who thought it's a good idea to g
+        response._num_proxy_tries = _num_proxy_tries
+
+        if (
+            self.response_cache is not None
+            and response.status_code == 200
+            and self.request_kwargs["method"] == "GET"
+        ):
+            self.response_cache[self.request_kwargs["url"]] = response
+
+        return response
+
+    async def _send(self) -> tuple[requests.Response, int]:
+        _num_proxy_tries = 0
+
+        for proxy in self.proxy_provider.iterate_proxies() if self.proxy_provider is not None else [None]:
+            _num_proxy_tries += 1
+
+            proxy_url = str(urllib3.util.Url(
+                host=proxy.url,
+                auth=f"{proxy.auth.login}:{proxy.auth.password}" if proxy.auth is not None else None,
+                port=proxy.port,
+                scheme="http"
+            )) if proxy is not None else None
+
+            request_future = self.request_executor.submit(
+                _do_request, self.session, self.request_kwargs, proxy_url
+            )
+            future = asyncio.wrap_future(request_future)
+            if self.inflight is not None:
+                self.inflight[future] = request_future
+
+            try:
+                response = await future
+            except asyncio.CancelledError:
+                # closing the client takes the request out of inflight before cancelling it, the task waiting for it
+                # is not being cancelled
+                if self.inflight is not None and future not in self.inflight:
+                    raise PlanClientError("The client was closed.", None) from None
+                raise
+            except (TimeoutError, requests.exceptions.ReadTimeout, requests.exceptions.ProxyError,
+                    requests.exceptions.SSLError, urllib3.exceptions.ConnectTimeoutError):
+                if self.proxy_provider:
+                    self.proxy_provider.mark_broken(proxy)
+                    continue
                 else:
-                    if self.proxy_provider:
-                        self.proxy_provider.mark_working(proxy)
-
-                    if response.status_code == 401:
-                        raise UnauthorizedError(f"Invalid credentials for request to {response.url!r}.",
-                                                response.status_code)
-                    elif response.status_code == 304:
-                        raise NotModifiedError(
-                            f"The requested ressource at {response.url!r} has not been modified since.",
-                            response.status_code)
-
-                    response.encoding = "utf-8"  # who thought it's a good idea to g
-                    response._num_proxy_tries = _num_proxy_tries
-                    return response
-        finally:
-            if not self.no_delay:
-                async def release_lock():
-                    await asyncio.sleep(_DELAY_BETWEEN_REQUESTS)
-                    REQUEST_LOCK.release()
-
-                asyncio.create_task(release_lock())
+                    raise
+            except requests.ConnectionError as e:
+                if not self.proxy_provider:
+                    raise
+                self.proxy_provider.mark_broken(proxy)
+                if not _is_known_proxy_connection_error(e, proxy):
+                    logging.error("Unhandled requests.ConnectionError.", exc_info=e)
+
+            else:
+                if self.proxy_provider:
+                    self.proxy_provider.mark_working(proxy, response.elapsed.total_seconds())
+
+                return response, _num_proxy_tries
+            finally:
+                if self.inflight is not None:
+                    self.inflight.pop(future, None)
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         pass
 
 
+_HTTP_DATE_DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_HTTP_DATE_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _create_session() -> requests.Session:
+    # requests' default adapter keeps at most 10 connections per host, too few for concurrent fetches
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=64, pool_block=False)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# a poller of dated plans requests a new url every day, only the most recently used ones are kept
+_CONDITIONAL_CACHE_SIZE = 32
+
+
+class _ResponseCache:
+    """The last 200 response per url, for the most recently used urls."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._responses: collections.OrderedDict[str, requests.Response] = collections.OrderedDict()
+
+    def get(self, url: str) -> requests.Response | None:
+        response = self._responses.get(url)
+        if response is not None:
+            self._responses.move_to_end(url)
+
+        return response
+
+    def __setitem__(self, url: str, response: requests.Response):
+        self._responses[url] = response
+        self._responses.move_to_end(url)
+
+        if len(self._responses) > self.maxsize:
+            self._responses.popitem(last=False)
+
+
+@functools.lru_cache(maxsize=256)
+def _format_http_date(timestamp: float) -> str:
+    # pollers send the same If-Modified-Since over and over
+    # names are hardcoded because HTTP dates must not depend on the locale like strftime's %a and %b
+    dt = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    return (
+        f"{_HTTP_DATE_DAYS[dt.weekday()]}, {dt.day:02d} {_HTTP_DATE_MONTHS[dt.month - 1]} {dt.year:04d} "
+        f"{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d} GMT"
+    )
+
+
 class PlanClient(abc.ABC):
     def __init__(self, credentials: Credentials | None, session: requests.Session | None = None,
                  no_delay: bool = False, proxy_provider: proxies.ProxyProvider | None = None,
-                 request_executor: concurrent.futures.Executor | None = None):
+                 request_executor: concurrent.futures.Executor | None = None,
+                 conditional_cache: bool = False, circuit_breaker: CircuitBreaker | None = None):
         self.credentials = credentials
-        self.session = requests.Session() if session is None else session
+        self._auth = (
+            requests.auth.HTTPBasicAuth(credentials.username, credentials.password)
+            if credentials is not None else None
+        )
+        self.session = _create_session() if session is None else session
+        # a session that was passed in may be shared, its owner is responsible for closing it
+        self._owns_session = session is None
+        self._inflight: dict[asyncio.Future, concurrent.futures.Future] = {}
+        self.closed = False
         self.no_delay = no_delay
         self.proxy_provider = proxy_provider
-        self.request_executor = (
-            concurrent.futures.ThreadPoolExecutor() if request_executor is None else request_executor
+        self.request_executor = _REQUEST_EXECUTOR if request_executor is None else request_executor
+        # url: last 200 response, used to send conditional requests and to answer 304s
+        self._conditional_cache: _ResponseCache | None = (
+            _ResponseCache(_CONDITIONAL_CACHE_SIZE) if conditional_cache else None
         )
+        self.circuit_breaker = circuit_breaker
+        # set by the subclasses
+        self.endpoint: IndiwareMobilEndpoint | SubstitutionPlanEndpoint | None = None
+
+    @abc.abstractmethod
+    def get_url(self, date_or_filename: str | datetime.date | None = None) -> str:
+        ...
 
     @abc.abstractmethod
     async def fetch_plan(self, date_or_filename: str | datetime.date | None = None,
                          if_modified_since: datetime.datetime | None = None) -> PlanResponse:
         ...
 
+    async def get_metadata(self, date_or_filename: str | datetime.date | None = None) -> tuple[datetime.datetime, str]:
+        url = self.get_url(date_or_filename)
+
+        async with self.make_request(url, method="HEAD") as response:
+            _raise_for_plan_status(response, date_or_filename, url)
+
+            plan_response = PlanResponse("", response)
+
+            return plan_response.last_modified, plan_response.etag
+
     def make_request(
         self,
         url: str,
@@ -248,122 +459,227 @@ class PlanClient(abc.ABC):
         if_none_match: str | None = None,
         **kwargs
     ) -> PlanClientRequestContextManager:
+        if self.closed:
+            raise PlanClientError("The client is closed.", None)
+
+        cached_response = None
+        cache_validator_headers = {}
+        if (
+            self._conditional_cache is not None
+            and method == "GET"
+            and if_modified_since is None
+            and if_none_match is None
+            and (cached_response := self._conditional_cache.get(url)) is not None
+        ):
+            # the ETag is the more precise validator, only fall back to Last-Modified without one
+            if "ETag" in cached_response.headers:
+                cache_validator_headers["If-None-Match"] = cached_response.headers["ETag"]
+            elif "Last-Modified" in cached_response.headers:
+                cache_validator_headers["If-Modified-Since"] = cached_response.headers["Last-Modified"]
+            else:
+                cached_response = None
+
+        extra_headers = kwargs.pop("headers", None)
+        if cache_validator_headers or if_modified_since is not None or if_none_match is not None or extra_headers:
+            headers = _BASE_HEADERS | cache_validator_headers
+            if if_modified_since is not None:
+                headers["If-Modified-Since"] = _format_http_date(if_modified_since.timestamp())
+            if if_none_match is not None:
+                headers["If-None-Match"] = if_none_match
+            if extra_headers:
+                headers.update(extra_headers)
+        else:
+            headers = _BASE_HEADERS
+
         kwargs = dict(
             method=method,
             url=url,
-            auth=requests.auth.HTTPBasicAuth(self.credentials.username, self.credentials.password)
-            if self.credentials is not None else None,
+            auth=self._auth,
+            headers=headers,
             **kwargs
         )
 
-        if_modified_since_header = {"If-Modified-Since": (
-            if_modified_since.astimezone(datetime.timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT")
-        )} if if_modified_since is not None else {}
-
-        if_none_match_header = {"If-None-Match": if_none_match} if if_none_match is not None else {}
-
-        kwargs["headers"] = (
-            {"User-Agent": "Indiware"}
-            | if_modified_since_header
-            | if_none_match_header
-            | kwargs.get("headers", {})
-        )
-
         return PlanClientRequestContextManager(
             self.session,
             kwargs,
             no_delay=self.no_delay,
             proxy_provider=self.proxy_provider,
-            request_executor=self.request_executor
+            request_executor=self.request_executor,
+            response_cache=self._conditional_cache,
+            cached_response=cached_response,
+            inflight=self._inflight,
+            circuit_breaker=self.circuit_breaker
         )
 
+    async def warmup(self):
+        """Optional. Open a connection to the endpoint so that the first plan request does not have to."""
+        if self.endpoint is None:
+            return
+
+        try:
+            async with self.make_request(self.endpoint.url, method="HEAD"):
+                pass
+        except (PlanClientError, requests.RequestException):
+            pass
+
     async def close(self):
-        self.session.close()
+        if self.closed:
+            return
+        self.closed = True
+
+        inflight = list(self._inflight.items())
+        self._inflight.clear()
+
+        # the callers waiting for these get a PlanClientError
+        for future, _ in inflight:
+            future.cancel()
+
+        # requests that have already started keep running in their threads, the session must outlive them
+        if inflight:
+            await asyncio.gather(
+                *(asyncio.wrap_future(request_future) for _, request_future in inflight), return_exceptions=True
+            )
+
+        if self._owns_session:
+            self.session.close()
+
+    async def __aenter__(self) -> typing.Self:
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+def _raise_for_plan_status(response: requests.Response, date_or_filename: str | datetime.date | None, url: str):
+    if response.status_code == 404:
+        raise PlanNotFoundError(f"No plan for {date_or_filename=} found.", response.status_code)
+    elif response.status_code != 200:
+        raise PlanClientError(f"Unexpected status code {response.status_code} for request to {url=}.",
+                              response.status_code)
+
+
+def _parse_vpdir_datetime(date_str: str) -> datetime.datetime:
+    # "%d.%m.%Y %H:%M", parsed by hand because strptime is slow
+    if len(date_str) != 16:
+        # not zero-padded, let strptime deal with it
+        return datetime.datetime.strptime(date_str, "%d.%m.%Y %H:%M").replace(tzinfo=datetime.timezone.utc)
+
+    return datetime.datetime(
+        int(date_str[6:10]), int(date_str[3:5]), int(date_str[0:2]), int(date_str[11:13]), int(date_str[14:16]),
+        tzinfo=datetime.timezone.utc
+    )
 
 
 class IndiwareMobilClient(PlanClient):
     def __init__(self, endpoint: IndiwareMobilEndpoint, credentials: Credentials | None,
-                 session: requests.Session | None = None, no_delay=True):
-        super().__init__(credentials, session, no_delay)
+                 session: requests.Session | None = None, no_delay=True, conditional_cache: bool = False,
+                 circuit_breaker: CircuitBreaker | None = None):
+        super().__init__(credentials, session, no_delay, conditional_cache=conditional_cache,
+                         circuit_breaker=circuit_breaker)
 
         self.endpoint = endpoint
 
-    async def fetch_plan(
-        self,
-        date_or_filename: str | datetime.date | None = None,
-        **kwargs
-    ) -> PlanResponse:
+        # joined once, the placeholders survive urljoin
+        self._plan_url = urllib.parse.urljoin(endpoint.url, endpoint.plan_file_url2)
+        self._dated_plan_url = urllib.parse.urljoin(endpoint.url, endpoint.plan_file_url)
+        self._file_url = urllib.parse.urljoin(endpoint.url, Endpoints.indiware_mobil_file)
+        self._vpdir_url = urllib.parse.urljoin(endpoint.url, Endpoints.indiware_mobil_vpdir)
+        # the form is the same for every request, so it is encoded only once
+        self._vpdir_body, self._vpdir_content_type = urllib3.encode_multipart_formdata({
+            "pw": "I N D I W A R E",
+            "art": endpoint.vpdir_password
+        })
+
+    def get_url(self, date_or_filename: str | datetime.date | None = None) -> str:
         if date_or_filename is None:
-            _url = self.endpoint.plan_file_url2
+            return self._plan_url
         elif isinstance(date_or_filename, str):
-            _url = Endpoints.indiware_mobil_file.format(filename=date_or_filename)
+            return self._file_url.format(filename=date_or_filename)
         elif isinstance(date_or_filename, datetime.date):
-            _url = self.endpoint.plan_file_url.format(date=date_or_filename.strftime("%Y%m%d"))
+            return self._dated_plan_url.format(date=date_or_filename.strftime("%Y%m%d"))
         else:
             raise TypeError(f"date_or_filename must be str, datetime.date or None, not {type(date_or_filename)!r}.")
 
-        url = urllib.parse.urljoin(self.endpoint.url, _url)
+    async def fetch_plan(
+        self,
+        date_or_filename: str | datetime.date | None = None,
+        **kwargs
+    ) -> PlanResponse:
+        url = self.get_url(date_or_filename)
 
         async with self.make_request(url, **kwargs) as response:
-            if response.status_code == 404:
-                raise PlanNotFoundError(f"No plan for {date_or_filename=} found.", response.status_code)
-            elif response.status_code != 200:
-                raise PlanClientError(f"Unexpected status code {response.status_code} for request to {url=}.",
-                                      response.status_code)
+            _raise_for_plan_status(response, date_or_filename, url)
 
             return PlanResponse(
-                content=response.text,
+                content=response.content.decode("utf-8", errors="replace"),
                 response=response
             )
 
+    async def fetch_plan_if_newer(
+        self,
+        date_or_filename: str | datetime.date | None,
+        last_known: datetime.datetime,
+        **kwargs
+    ) -> PlanResponse | None:
+        """Return the plan if it was modified after last_known, otherwise None. Needs only one request."""
+
+        try:
+            return await self.fetch_plan(date_or_filename, if_modified_since=last_known, **kwargs)
+        except NotModifiedError:
+            return None
+
     async def fetch_dates(self, **kwargs) -> dict[str, datetime.datetime]:
         """Return a dictionary of available file names and their last modification date."""
 
-        url = urllib.parse.urljoin(self.endpoint.url, Endpoints.indiware_mobil_vpdir)
+        url = self._vpdir_url
 
-        multipart_dict = {
-            "pw": (None, "I N D I W A R E"),
-            "art": (None, self.endpoint.vpdir_password)
-        }
+        headers = {"Content-Type": self._vpdir_content_type} | kwargs.pop("headers", {})
 
-        async with self.make_request(url, method="POST", files=multipart_dict, **kwargs) as response:
+        async with self.make_request(url, method="POST", data=self._vpdir_body, headers=headers,
+                                     **kwargs) as response:
             if response.status_code != 200:
                 raise PlanClientError(f"Unexpected status code {response.status_code} for request to {url=}.",
                                       response.status_code)
 
-            _out = response.text.split(";")
+            text = response.content.decode("utf-8", errors="replace")
 
+        # "filename;date;filename;date;...", scanned in place instead of splitting into a list first
         out: dict[str, datetime.datetime] = {}
-        for i in range(0, len(_out), 2):
-            if not _out[i]:
-                continue
+        i = 0
+        while (j := text.find(";", i)) != -1:
+            k = text.find(";", j + 1)
+            if k == -1:
+                k = len(text)
 
-            filename, date_str = _out[i:i + 2]
+            if j > i:
+                out[text[i:j]] = _parse_vpdir_datetime(text[j + 1:k])
 
-            out[filename] = (
-                datetime.datetime.strptime(date_str, "%d.%m.%Y %H:%M")
-                .replace(tzinfo=datetime.timezone.utc)
-            )
+            i = k + 1
 
         return out
 
 
 class SubstitutionPlanClient(PlanClient):
     def __init__(self, endpoint: SubstitutionPlanEndpoint, credentials: Credentials | None,
-                 session: requests.Session | None = None, no_delay=False):
-        super().__init__(credentials, session, no_delay)
+                 session: requests.Session | None = None, no_delay=False, conditional_cache: bool = False,
+                 circuit_breaker: CircuitBreaker | None = None):
+        super().__init__(credentials, session, no_delay, conditional_cache=conditional_cache,
+                         circuit_breaker=circuit_breaker)
 
         self.endpoint = endpoint
 
+        # joined once, the placeholders survive urljoin
+        self._dated_plan_url = urllib.parse.urljoin(endpoint.url, endpoint.plan_file_url2)
+        self._plan_url = self._dated_plan_url.format(date="")
+        self._file_url = urllib.parse.urljoin(endpoint.url, Endpoints.substitution_plan)
+
     def get_url(self, date_or_filename: str | datetime.date | None = None) -> str:
         if date_or_filename is None:
-            _url = self.endpoint.plan_file_url2.format(date="")
+            return self._plan_url
         elif isinstance(date_or_filename, str):
-            _url = Endpoints.substitution_plan.format(filename=date_or_filename)
+            return self._file_url.format(filename=date_or_filename)
         else:
-            _url = self.endpoint.plan_file_url2.format(date=date_or_filename.strftime("%Y%m%d"))
-
-        return urllib.parse.urljoin(self.endpoint.url, _url)
+            return self._dated_plan_url.format(date=date_or_filename.strftime("%Y%m%d"))
 
     async def fetch_plan(
         self,
@@ -373,72 +689,111 @@ class SubstitutionPlanClient(PlanClient):
         url = self.get_url(date_or_filename)
 
         async with self.make_request(url, **kwargs) as response:
-            if response.status_code == 404:
-                raise PlanNotFoundError(f"No plan for {date_or_filename=} found.", response.status_code)
-            elif response.status_code != 200:
-                raise PlanClientError(f"Unexpected status code {response.status_code} for request to {url=}.",
-                                      response.status_code)
+            _raise_for_plan_status(response, date_or_filename, url)
 
             return PlanResponse(
-                content=response.text,
+                content=response.content.decode("utf-8", errors="replace"),
                 response=response
             )
 
-    async def get_metadata(self, date_or_filename: str | datetime.date | None = None) -> tuple[datetime.datetime, str]:
-        url = self.get_url(date_or_filename)
 
-        async with self.make_request(url, method="HEAD") as response:
-            if response.status_code == 404:
-                raise PlanNotFoundError(f"No plan for {date_or_filename=} found.", response.status_code)
-            elif response.status_code != 200:
-                raise PlanClientError(f"Unexpected status code {response.status_code} for request to {url=}.",
-                                      response.status_code)
+class IndiwareStundenplanerClient:
+    def __init__(self, hosting: Hosting, session: requests.Session | None = None, *,
+                 conditional_cache: bool = False, circuit_breaker: bool = False):
+        """conditional_cache and circuit_breaker are passed on to the sub-clients. With circuit_breaker, the
+        sub-clients of one host share a CircuitBreaker."""
+        self.hosting = hosting
+        self._owns_session = session is None
 
-            plan_response = PlanResponse("", response)
+        if session is None:
+            # the sub-clients usually talk to the same host, so let them share one pool of connections
+            session = _create_session()
+        self.session = session
 
-            return plan_response.last_modified, plan_response.etag
+        circuit_breakers: dict[str, CircuitBreaker] = {}
 
+        def client_kwargs(endpoint) -> dict[str, typing.Any]:
+            host = urllib.parse.urlsplit(endpoint.url).netloc
+            if circuit_breaker and host not in circuit_breakers:
+                circuit_breakers[host] = CircuitBreaker()
 
-class IndiwareStundenplanerClient:
-    def __init__(self, hosting: Hosting, session: requests.Session | None = None):
-        self.hosting = hosting
+            return dict(
+                session=session,
+                conditional_cache=conditional_cache,
+                circuit_breaker=circuit_breakers.get(host)
+            )
 
         self.form_plan_client = (
-            IndiwareMobilClient(hosting.indiware_mobil.forms, hosting.creds, session=session)
+            IndiwareMobilClient(hosting.indiware_mobil.forms, hosting.creds,
+                                **client_kwargs(hosting.indiware_mobil.forms))
             if hosting.indiware_mobil.forms is not None else None
         )
         self.teacher_plan_client = (
-            IndiwareMobilClient(hosting.indiware_mobil.teachers, hosting.creds, session=session)
+            IndiwareMobilClient(hosting.indiware_mobil.teachers, hosting.creds,
+                                **client_kwargs(hosting.indiware_mobil.teachers))
             if hosting.indiware_mobil.teachers is not None else None
         )
         self.room_plan_client = (
-            IndiwareMobilClient(hosting.indiware_mobil.rooms, hosting.creds, session=session)
+            IndiwareMobilClient(hosting.indiware_mobil.rooms, hosting.creds,
+                                **client_kwargs(hosting.indiware_mobil.rooms))
             if hosting.indiware_mobil.rooms is not None else None
         )
 
         self.students_substitution_plan_client = SubstitutionPlanClient(
-            hosting.substitution_plan.students, hosting.creds, session=session
+            hosting.substitution_plan.students, hosting.creds, **client_kwargs(hosting.substitution_plan.students)
         ) if hosting.substitution_plan.students is not None else None
         self.teachers_substitution_plan_client = SubstitutionPlanClient(
-            hosting.substitution_plan.teachers, hosting.creds, session=session
+            hosting.substitution_plan.teachers, hosting.creds, **client_kwargs(hosting.substitution_plan.teachers)
         ) if hosting.substitution_plan.teachers is not None else None
 
-    @property
-    def indiware_mobil_clients(self):
-        return filter(
-            lambda x: x is not None,
-            (self.form_plan_client, self.teacher_plan_client, self.room_plan_client)
+        self.indiware_mobil_clients: tuple[IndiwareMobilClient, ...] = tuple(
+            client for client in (self.form_plan_client, self.teacher_plan_client, self.room_plan_client)
+            if client is not None
+        )
+        self.substitution_plan_clients: tuple[SubstitutionPlanClient, ...] = tuple(
+            client for client in (self.students_substitution_plan_client, self.teachers_substitution_plan_client)
+            if client is not None
         )
 
-    @property
-    def substitution_plan_clients(self):
-        return filter(
-            lambda x: x is not None,
-            (self.students_substitution_plan_client, self.teachers_substitution_plan_client)
+    async def fetch_indiware_mobil_plans(
+        self,
+        date_or_filename: str | datetime.date | None = None,
+        **kwargs
+    ) -> list[PlanResponse | BaseException]:
+        """Fetch the plans of all Indiware Mobil endpoints concurrently. Failed fetches are returned as their
+        exception."""
+        return await asyncio.gather(
+            *(client.fetch_plan(date_or_filename, **kwargs) for client in self.indiware_mobil_clients),
+            return_exceptions=True
+        )
+
+    async def fetch_substitution_plans(
+        self,
+        date_or_filename: str | datetime.date | None = None,
+        **kwargs
+    ) -> list[PlanResponse | BaseException]:
+        """Fetch the plans of all substitution plan endpoints concurrently. Failed fetches are returned as their
+        exception."""
+        return await asyncio.gather(
+            *(client.fetch_plan(date_or_filename, **kwargs) for client in self.substitution_plan_clients),
+            return_exceptions=True
         )
 
+    async def warmup(self):
+        await asyncio.gather(*(
+            client.warmup() for client in itertools.chain(self.indiware_mobil_clients, self.substitution_plan_clients)
+        ))
+
     async def close(self):
         await asyncio.gather(*(
-            [client.close() for client in self.indiware_mobil_clients]
-            + [client.close() for client in self.substitution_plan_clients]
+            client.close() for client in itertools.chain(self.indiware_mobil_clients, self.substitution_plan_clients)
         ))
+
+        if self._owns_session:
+            self.session.close()
+
+    async def __aenter__(self) -> typing.Self:
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
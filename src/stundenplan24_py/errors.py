@@ -21,3 +21,7 @@ class NotModifiedError(PlanClientError):
 
 class NoProxyAvailableError(PlanClientError):
     pass
+
+
+class CircuitOpenError(PlanClientError):
+    pass
@@ -2,12 +2,15 @@ from __future__ import annotations
 
 import dataclasses
 import datetime
+import functools
 import typing
 import xml.etree.ElementTree as ET
+import zoneinfo
 
-import pytz
-
-from .shared import parse_free_days, parse_plan_date, Value, Exam
+from .shared import (
+    get_value, index_children, intern_text, iterparse_xml, parse_free_days, parse_plan_date, parse_plan_timestamp,
+    parse_time, Value, Exam
+)
 
 __all__ = [
     "IndiwareMobilPlan",
@@ -16,8 +19,15 @@ __all__ = [
     "Class"
 ]
 
+_BERLIN = zoneinfo.ZoneInfo("Europe/Berlin")
+
 
 class IndiwareMobilPlan:
+    __slots__ = (
+        "plan_type", "timestamp", "date", "filename", "native", "week", "days_per_week", "school_number", "free_days",
+        "forms", "additional_info"
+    )
+
     plan_type: str
     timestamp: datetime.datetime | None  # time of last update
     date: datetime.date
@@ -25,7 +35,7 @@ class IndiwareMobilPlan:
     native: str
     week: int
     days_per_week: int
-    school_number: int = None
+    school_number: int | None
 
     free_days: list[datetime.date]
     forms: list[Form]
@@ -35,23 +45,7 @@ class IndiwareMobilPlan:
     def from_xml(cls, xml: ET.Element):
         day = cls()
 
-        # parse head
-        head = xml.find("Kopf")
-        day.plan_type = head.find("planart").text
-
-        day.timestamp = (
-            pytz.timezone("Europe/Berlin")
-            .localize(datetime.datetime.strptime(head.find("zeitstempel").text, "%d.%m.%Y, %H:%M"))
-        ) if head.find("zeitstempel") is not None else None
-        day.date = parse_plan_date(head.find("DatumPlan").text)
-        day.filename = head.find("datei").text
-        day.native = int(nativ.text) if (nativ := head.find("nativ")) is not None else None
-        day.week = int(head.find("woche").text) if head.find("woche") is not None else None
-        day.days_per_week = int(head.find("tageprowoche").text) if head.find("tageprowoche") is not None else 5
-        try:
-            day.school_number = int(head.find("schulnummer").text)
-        except (AttributeError, TypeError):
-            day.school_number = None
+        day._parse_head(xml.find("Kopf"))
 
         # parse free days
         ft_tag = xml.find("FreieTage")
@@ -62,17 +56,69 @@ class IndiwareMobilPlan:
         for class_ in xml.find("Klassen"):
             day.forms.append(Form.from_xml(class_))
 
-        # parse additional info
+        day._parse_additional_info(xml.find("ZusatzInfo"))
+
+        return day
+
+    @classmethod
+    def from_stream(cls, source: str | typing.BinaryIO) -> typing.Self:
+        """Parse a plan from a file name or binary file object without building the whole tree. Every form is removed
+        from the tree as soon as it is parsed, so memory use does not grow with the number of forms."""
+        day = cls()
+        day.free_days = []
+        day.forms = []
         day.additional_info = []
-        _additional_info = xml.find("ZusatzInfo")
-        _additional_info = _additional_info if _additional_info is not None else []
-        for line in _additional_info:
-            day.additional_info.append(line.text)
+
+        ancestors: list[ET.Element] = []
+        for event, element in iterparse_xml(source, events=("start", "end")):
+            if event == "start":
+                ancestors.append(element)
+                continue
+
+            ancestors.pop()
+
+            if len(ancestors) == 1:
+                # direct child of the root element
+                if element.tag == "Kopf":
+                    day._parse_head(element)
+                elif element.tag == "FreieTage":
+                    day.free_days = parse_free_days(element)
+                elif element.tag == "ZusatzInfo":
+                    day._parse_additional_info(element)
+
+                ancestors[0].remove(element)
+            elif len(ancestors) == 2 and ancestors[1].tag == "Klassen":
+                day.forms.append(Form.from_xml(element))
+                ancestors[1].remove(element)
 
         return day
 
+    def _parse_head(self, head: ET.Element):
+        self.plan_type = head.find("planart").text
+
+        self.timestamp = (
+            parse_plan_timestamp(head.find("zeitstempel").text).replace(tzinfo=_BERLIN)
+        ) if head.find("zeitstempel") is not None else None
+        self.date = parse_plan_date(head.find("DatumPlan").text)
+        self.filename = head.find("datei").text
+        self.native = int(nativ.text) if (nativ := head.find("nativ")) is not None else None
+        self.week = int(head.find("woche").text) if head.find("woche") is not None else None
+        self.days_per_week = int(head.find("tageprowoche").text) if head.find("tageprowoche") is not None else 5
+        school_number = head.find("schulnummer")
+        self.school_number = (
+            int(school_number.text) if school_number is not None and school_number.text is not None else None
+        )
+
+    def _parse_additional_info(self, additional_info: ET.Element | None):
+        self.additional_info = []
+        additional_info = additional_info if additional_info is not None else []
+        for line in additional_info:
+            self.additional_info.append(line.text)
+
 
 class Form:
+    __slots__ = ("short_name", "hash", "periods", "courses", "classes", "lessons", "exams", "break_supervisions")
+
     short_name: str
     hash: str | None
 
@@ -87,73 +133,76 @@ class Form:
     def from_xml(cls, xml: ET.Element):
         form = cls()
 
-        form.short_name = xml.find("Kurz").text
-        try:
-            form.hash = xml.find("Hash").text
-        except AttributeError:
-            form.hash = None
+        children = index_children(xml)
+
+        form.short_name = children.get("Kurz").text
+        form.hash = hash_.text if (hash_ := children.get("Hash")) is not None else None
 
         # parse periods
         form.periods = {}
-        for period in xml.find("KlStunden") or []:
+        for period in children.get("KlStunden", ()):
             start, end = period.attrib["ZeitVon"].strip(), period.attrib["ZeitBis"].strip()
             try:
-                start = datetime.datetime.strptime(start, "%H:%M").time()
+                start = parse_time(start)
             except ValueError:
                 continue
             try:
-                end = datetime.datetime.strptime(end, "%H:%M").time()
+                end = parse_time(end)
             except ValueError:
                 continue
-            form.periods |= {int(period.text): (start, end)}
+            form.periods[int(period.text)] = (start, end)
 
         # parse courses
         form.courses = {}
-        for _course in xml.find("Kurse") or []:
-            course = _course.find("KKz")
-            form.courses |= {course.text: course.attrib["KLe"]}
+        for course in xml.iterfind("Kurse/*/KKz"):
+            form.courses[intern_text(course.text)] = intern_text(course.attrib["KLe"])
 
         # parse classes
         form.classes = {}
-        for _class in xml.find("Unterricht") or []:
-            class_ = _class.find("UeNr")
-            class_obj = Class(
-                teacher=class_.attrib["UeLe"],
-                subject=class_.attrib["UeFa"],
-                group=class_.attrib["UeGr"] if "UeGr" in class_.attrib else None
+        for class_ in xml.iterfind("Unterricht/*/UeNr"):
+            class_obj = _get_class(
+                intern_text(class_.attrib["UeLe"]),
+                intern_text(class_.attrib["UeFa"]),
+                intern_text(class_.attrib["UeGr"]) if "UeGr" in class_.attrib else None
             )
-            form.classes |= {class_.text: class_obj}
+            form.classes[class_.text] = class_obj
 
         # parse lessons
         form.lessons = []
-        for _lesson in xml.find("Pl"):
+        for _lesson in children.get("Pl"):
             form.lessons.append(Lesson.from_xml(_lesson))
 
         # parse exams
         form.exams = []
-        for _exam in xml.find("Klausuren") or []:
+        for _exam in children.get("Klausuren", ()):
             form.exams.append(Exam.from_xml_indiware_mobile(_exam))
 
         # parse break supervisions
         form.break_supervisions = []
-        for _break_supervision in xml.find("Aufsichten") or []:
+        for _break_supervision in children.get("Aufsichten", ()):
             form.break_supervisions.append(BreakSupervision.from_xml(_break_supervision))
 
         return form
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True, frozen=True)
 class Class:
     teacher: str
     subject: str
     group: str | None
 
 
+# Class is immutable, so equal classes can be shared between forms and plans
+_get_class = functools.lru_cache(maxsize=1024)(Class)
+
+
 BREAK_SUPERVISION_SUBSTITUTION = "AuVertretung"
 BREAK_SUPERVISION_CANCELLED = "AuAusfall"
 
 
 class BreakSupervision:
+    __slots__ = ("status", "day", "before_period", "clock_time", "time_label", "location", "instead_of", "information")
+
     status: str | None
     day: int
     before_period: int
@@ -169,9 +218,9 @@ class BreakSupervision:
 
         out.status = xml.get("AuAe")
 
-        out.day = int(xml.find("AuTag").text)
-        out.before_period = int(xml.find("AuVorStunde").text)
-        out.clock_time = datetime.datetime.strptime(xml.find("AuUhrzeit").text, "%H:%M").time()
+        out.day = int(xml.findtext("AuTag"))
+        out.before_period = int(xml.findtext("AuVorStunde"))
+        out.clock_time = parse_time(xml.findtext("AuUhrzeit"))
         out.time_label = xml.find("AuZeit").text
         out.location = xml.find("AuOrt").text
 
@@ -182,6 +231,8 @@ class BreakSupervision:
 
 
 class Lesson:
+    __slots__ = ("period", "start", "end", "subject", "teacher", "room", "course2", "class_number", "information")
+
     period: int
     start: datetime.time
     end: datetime.time
@@ -198,23 +249,25 @@ class Lesson:
     @classmethod
     def from_xml(cls, xml: ET.Element):
         lesson = cls()
-
-        lesson.period = int(xml.find("St").text)
-        lesson.start = (datetime.datetime.strptime(beg.text.strip().replace(".", ":"), "%H:%M").time()
-                        if (beg := xml.find("Beginn")) is not None and beg.text else None)
-        lesson.end = (datetime.datetime.strptime(end.text.strip().replace(".", ":"), "%H:%M").time()
-                      if (end := xml.find("Ende")) is not None and end.text else None)
-
-        lesson.subject = Value(xml.find("Fa").text, xml.find("Fa").get("FaAe") == "FaGeaendert")
-        lesson.teacher = Value(xml.find("Le").text, xml.find("Le").get("LeAe") == "LeGeaendert")
-        lesson.room = Value(xml.find("Ra").text, xml.find("Ra").get("RaAe") == "RaGeaendert")
-
-        lesson.course2 = ku2.text if (ku2 := xml.find("Ku2")) is not None else None
-
-        try:
-            lesson.class_number = xml.find("Nr").text
-        except AttributeError:
-            lesson.class_number = None
-        lesson.information = xml.find("If").text.strip() if xml.find("If").text is not None else None
+        children = index_children(xml)
+
+        lesson.period = int(children.get("St").text)
+        lesson.start = (parse_time(beg.text.strip().replace(".", ":"))
+                        if (beg := children.get("Beginn")) is not None and beg.text else None)
+        lesson.end = (parse_time(end.text.strip().replace(".", ":"))
+                      if (end := children.get("Ende")) is not None and end.text else None)
+
+        subject = children.get("Fa")
+        teacher = children.get("Le")
+        room = children.get("Ra")
+        lesson.subject = get_value(intern_text(subject.text), subject.get("FaAe") == "FaGeaendert")
+        lesson.teacher = get_value(intern_text(teacher.text), teacher.get("LeAe") == "LeGeaendert")
+        lesson.room = get_value(intern_text(room.text), room.get("RaAe") == "RaGeaendert")
+
+        lesson.course2 = ku2.text if (ku2 := children.get("Ku2")) is not None else None
+
+        lesson.class_number = nr.text if (nr := children.get("Nr")) is not None else None
+        information = children.get("If").text
+        lesson.information = information.strip() if information is not None else None
 
         return lesson
@@ -2,9 +2,12 @@ from __future__ import annotations
 
 import dataclasses
 import datetime
+import heapq
 import json
 import logging
+import os
 import random
+import threading
 import typing
 from pathlib import Path
 
@@ -15,12 +18,48 @@ from .errors import NoProxyAvailableError
 import aiohttp
 import pubproxpy.errors
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-@dataclasses.dataclass
+
+def _dump_json(data: typing.Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+
+    return json.dumps(data).encode("utf-8")
+
+
+def _load_json(data: bytes) -> typing.Any:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+def _serialize_datetime(dt: datetime.datetime | None) -> float | None:
+    return dt.timestamp() if dt is not None else None
+
+
+def _deserialize_datetime(value: float | str | None) -> datetime.datetime | None:
+    if value is None:
+        return None
+
+    if isinstance(value, str):
+        # caches written before timestamps were stored as numbers
+        return datetime.datetime.fromisoformat(value)
+
+    return datetime.datetime.fromtimestamp(value)
+
+
+@dataclasses.dataclass(slots=True)
 class _Proxy:
     auth: aiohttp.BasicAuth | None = None
     score: float = 1
     tries: int = 0
+    latency: float | None = None  # exponentially weighted moving average, seconds
 
     last_worked: datetime.datetime | None = None
     last_blocked: datetime.datetime | None = None
@@ -33,9 +72,10 @@ class _Proxy:
             "auth": self.auth.encode() if self.auth is not None else None,
             "score": self.score,
             "tries": self.tries,
-            "last_worked": self.last_worked.isoformat() if self.last_worked is not None else None,
-            "last_blocked": self.last_blocked.isoformat() if self.last_blocked is not None else None,
-            "last_broken": self.last_broken.isoformat() if self.last_broken is not None else None
+            "latency": self.latency,
+            "last_worked": _serialize_datetime(self.last_worked),
+            "last_blocked": _serialize_datetime(self.last_blocked),
+            "last_broken": _serialize_datetime(self.last_broken)
         }
 
     @classmethod
@@ -44,35 +84,46 @@ class _Proxy:
             auth=aiohttp.BasicAuth.decode(data["auth"]) if data["auth"] is not None else None,
             score=data["score"],
             tries=data["tries"],
-            last_worked=datetime.datetime.fromisoformat(data["last_worked"]) if data["last_worked"] else None,
-            last_blocked=datetime.datetime.fromisoformat(data["last_blocked"]) if data["last_blocked"] else None,
-            last_broken=datetime.datetime.fromisoformat(data["last_broken"]) if data["last_broken"] else None,
+            latency=data.get("latency"),
+            last_worked=_deserialize_datetime(data["last_worked"]),
+            last_blocked=_deserialize_datetime(data["last_blocked"]),
+            last_broken=_deserialize_datetime(data["last_broken"]),
         )
 
+    @property
+    def health(self) -> float:
+        return self.score / (1 + (self.latency or 0))
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True)
 class Proxy:
     url: str
     port: int
     auth: aiohttp.BasicAuth | None = None
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Proxies:
     proxies: dict[tuple[str, int], _Proxy]
 
     def serialize(self) -> dict:
         return {
-            "proxies": {f"{url}:{port}": proxy.serialize() for (url, port), proxy in self.proxies.items()}
+            "proxies": [{"url": url, "port": port, **proxy.serialize()} for (url, port), proxy in self.proxies.items()]
         }
 
     @classmethod
     def deserialize(cls, data: dict) -> Proxies:
+        if isinstance(data["proxies"], dict):
+            # caches written before proxies were stored as a list, keyed by "url:port"
+            return cls(
+                proxies={
+                    ((s := key.rsplit(":", 1))[0], int(s[1])): _Proxy.deserialize(value)
+                    for key, value in data["proxies"].items()
+                }
+            )
+
         return cls(
-            proxies={
-                ((s := key.rsplit(":", 1))[0], int(s[1])): _Proxy.deserialize(value)
-                for key, value in data["proxies"].items()
-            }
+            proxies={(value["url"], int(value["port"])): _Proxy.deserialize(value) for value in data["proxies"]}
         )
 
     def _get_proxy(self, url: str, port: int) -> _Proxy:
@@ -93,12 +144,15 @@ class Proxies:
 
 
 class ProxyProvider:
-    def __init__(self, cache_file: Path, *, never_raise_out_of_proxies: bool = False):
+    def __init__(self, cache_file: Path, *, never_raise_out_of_proxies: bool = False,
+                 order_by_health: bool = False, save_delay: float = 10):
         self._logger = logging.getLogger(self.__class__.__name__)
         self.cache_file = cache_file
 
         self.proxies: Proxies = Proxies(proxies={})
         self.never_raise_out_of_proxies = never_raise_out_of_proxies
+        # try fast and reliable proxies first instead of picking randomly weighted by score
+        self.order_by_health = order_by_health
 
         self.proxy_fetcher = pubproxpy.ProxyFetcher(
             # https=True,
@@ -107,14 +161,22 @@ class ProxyProvider:
             time_to_connect=10
         )
 
-        self._i = 0
+        # changes are written at most every save_delay seconds from a background thread
+        self.save_delay = save_delay
+        self._dirty = False
+        self._save_timer: threading.Timer | None = None
+        # guards the pool, _dirty and _save_timer. the pool is changed on the callers' thread and serialized on the
+        # save thread, the lock is never held while writing to disk
+        self._lock = threading.Lock()
+        # keeps concurrent writers from replacing a newer snapshot with an older one
+        self._write_lock = threading.Lock()
 
         self.load_proxies()
 
     def load_proxies(self):
         self._logger.info("* Loading proxies.")
         try:
-            data = json.loads(self.cache_file.read_text("utf-8"))
+            data = _load_json(self.cache_file.read_bytes())
         except FileNotFoundError:
             self._logger.info("=> No proxies cached yet.")
         except json.JSONDecodeError:
@@ -126,7 +188,28 @@ class ProxyProvider:
 
     def store_proxies(self):
         self._logger.debug(f"* Storing proxies at {str(self.cache_file)!r}.")
-        self.cache_file.write_text(json.dumps(self.proxies.serialize()), "utf-8")
+
+        with self._write_lock:
+            with self._lock:
+                self._dirty = False
+                data = self.proxies.serialize()
+
+            # write to a temporary file first so that a crash never leaves a truncated cache behind
+            tmp_file = self.cache_file.with_name(self.cache_file.name + ".tmp")
+            tmp_file.write_bytes(_dump_json(data))
+            os.replace(tmp_file, self.cache_file)
+
+    def close(self):
+        """Write pending changes to the cache file."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+
+            dirty = self._dirty
+
+        if dirty:
+            self.store_proxies()
 
     def _fetch_proxies(self, proxy_fetcher: pubproxpy.ProxyFetcher) -> typing.Generator[Proxy, None, None]:
         while True:
@@ -159,10 +242,12 @@ class ProxyProvider:
                         auth=None
                     )
 
-                    self.proxies.add_proxy(proxy)
+                    with self._lock:
+                        self.proxies.add_proxy(proxy)
+                        self._update_save()
+
                     new.append(proxy)
 
-                self.store_proxies()
                 yield from new
 
     def fetch_proxies(self) -> typing.Generator[Proxy, None, None]:
@@ -200,67 +285,104 @@ class ProxyProvider:
             self._logger.warning("Retrying working proxies.")
 
     def _iterate_working_proxies(self):
-        proxies = self.proxies.proxies.copy()
-        while proxies:
-            try:
-                [p_addr, _p], = random.choices(
-                    population=list(proxies.items()),
-                    weights=[p.score for addr, p in proxies.items()],
-                    k=1
-                )
-            except ValueError:
-                # total weight == 0
-                break
-            del proxies[p_addr]
+        if self.order_by_health:
+            yield from self._iterate_healthy_proxies()
+            return
+
+        # weighted random order without replacement (Efraimidis-Spirakis): every proxy draws an exponentially
+        # distributed key with its score as rate, smallest key first. proxies with a score of 0 are never picked.
+        queue = [
+            (random.expovariate(_p.score), i, p_addr, _p)
+            for i, (p_addr, _p) in enumerate(self.proxies.proxies.items())
+            if _p.score > 0
+        ]
+        heapq.heapify(queue)
+
+        while queue:
+            _, _, p_addr, _p = heapq.heappop(queue)
 
-            # breakpoint()
             if _p.last_blocked and (datetime.datetime.now() - _p.last_blocked < datetime.timedelta(minutes=1)):
                 continue
 
             self._logger.log(logging.DEBUG - 2, f"Providing proxy {p_addr!r}. Score: {_p.score:.2f}.")
             yield Proxies._proxy_to_proxy(*p_addr, _p)
 
-    def _iterate_broken_proxies(self):
-        self._logger.warning("Ran out of good proxies. Trying proxies marked as broken...")
-        for p_addr, _p in self.proxies.proxies.copy().items():
-            if _p.score != 0:
+    def _iterate_healthy_proxies(self):
+        # heap instead of a full sort, callers usually only take the first few proxies.
+        # broken proxies are tried in _iterate_broken_proxies. equal health is common (every new proxy has 1.0),
+        # the index breaks ties so that addresses, whose ports may be str or int, are never compared
+        queue = [
+            (-_p.health, i, p_addr, _p)
+            for i, (p_addr, _p) in enumerate(self.proxies.proxies.items())
+            if _p.score > 0
+        ]
+        heapq.heapify(queue)
+
+        while queue:
+            _, _, p_addr, _p = heapq.heappop(queue)
+
+            if _p.last_blocked and (datetime.datetime.now() - _p.last_blocked < datetime.timedelta(minutes=1)):
                 continue
 
+            self._logger.log(logging.DEBUG - 2, f"Providing proxy {p_addr!r}. Health: {_p.health:.2f}.")
+            yield Proxies._proxy_to_proxy(*p_addr, _p)
+
+    def _iterate_broken_proxies(self):
+        self._logger.warning("Ran out of good proxies. Trying proxies marked as broken...")
+        # snapshot only the broken ones, the pool may change while we are suspended
+        broken = [(p_addr, _p) for p_addr, _p in self.proxies.proxies.items() if _p.score == 0]
+        for p_addr, _p in broken:
             self._logger.log(logging.DEBUG - 2, f"Providing proxy {p_addr!r}. Score: {_p.score:.2f}.")
             yield Proxies._proxy_to_proxy(*p_addr, _p)
 
     def _update_save(self):
-        n = 50
-        self._i += 1
+        # called with self._lock held
+        self._dirty = True
 
-        if self._i == n:
-            self.store_proxies()
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.save_delay, self._save_if_dirty)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _save_if_dirty(self):
+        with self._lock:
+            self._save_timer = None
+            dirty = self._dirty
 
-        self._i %= n
+        if dirty:
+            try:
+                self.store_proxies()
+            except OSError as e:
+                self._logger.error("Could not store proxies.", exc_info=e)
 
     def mark_blocked(self, proxy: Proxy):
         self._logger.log(logging.DEBUG - 1, f"* Marking proxy {proxy!r} as blocked.")
-        self.proxies._get_proxy(proxy.url, proxy.port).last_blocked = datetime.datetime.now()
-        self._update_save()
+        with self._lock:
+            self.proxies._get_proxy(proxy.url, proxy.port).last_blocked = datetime.datetime.now()
+            self._update_save()
 
-    def mark_working(self, proxy: Proxy):
+    def mark_working(self, proxy: Proxy, latency: float | None = None):
         self._logger.log(logging.DEBUG - 1, f"* Marking proxy {proxy!r} as working.")
 
-        _proxy = self.proxies._get_proxy(proxy.url, proxy.port)
-        _proxy.last_worked = datetime.datetime.now()
-        effective_tries = min(_proxy.tries, 200)
-        _proxy.score = (_proxy.score * effective_tries + 1) / (effective_tries + 1)
-        _proxy.tries += 1
+        with self._lock:
+            _proxy = self.proxies._get_proxy(proxy.url, proxy.port)
+            _proxy.last_worked = datetime.datetime.now()
+            if latency is not None:
+                _proxy.latency = latency if _proxy.latency is None else 0.8 * _proxy.latency + 0.2 * latency
+            effective_tries = min(_proxy.tries, 200)
+            _proxy.score = (_proxy.score * effective_tries + 1) / (effective_tries + 1)
+            _proxy.tries += 1
 
-        self._update_save()
+            self._update_save()
 
     def mark_broken(self, proxy: Proxy):
         self._logger.log(logging.DEBUG - 1, f"* Marking proxy {proxy!r} as broken.")
 
-        _proxy = self.proxies._get_proxy(proxy.url, proxy.port)
-        _proxy.last_broken = datetime.datetime.now()
-        effective_tries = min(_proxy.tries, 200)
-        _proxy.score = (_proxy.score * effective_tries) / (effective_tries + 1)
-        _proxy.tries += 1
+        with self._lock:
+            _proxy = self.proxies._get_proxy(proxy.url, proxy.port)
+            _proxy.last_broken = datetime.datetime.now()
+            effective_tries = min(_proxy.tries, 200)
+            _proxy.score = (_proxy.score * effective_tries) / (effective_tries + 1)
+            _proxy.tries += 1
 
-        self._update_save()
+            self._update_save()
@@ -2,56 +2,155 @@ from __future__ import annotations
 
 import dataclasses
 import datetime
+import functools
+import sys
+import threading
+import typing
 import xml.etree.ElementTree as ET
 
 __all__ = [
+    "parse_xml",
     "Value",
     "Exam"
 ]
 
+# lxml parsers must not be shared between threads, every thread builds its own on first use
+_lxml_parsers = threading.local()
+
+
+@functools.cache
+def _import_lxml_etree():
+    # imported on first use so that importing the package stays cheap
+    try:
+        from lxml import etree
+    except ImportError:
+        return None
+
+    return etree
+
+
+def _get_lxml_parser(lxml_etree):
+    try:
+        return _lxml_parsers.parser
+    except AttributeError:
+        parser = _lxml_parsers.parser = lxml_etree.XMLParser(
+            collect_ids=False, huge_tree=False, remove_comments=True, remove_pis=True
+        )
+        return parser
+
+
+def parse_xml(data: str | bytes) -> ET.Element:
+    """Parse a plan file. Uses lxml if it is installed, which is considerably faster than ElementTree. The returned
+    element supports the ElementTree API the from_xml methods need either way."""
+
+    lxml_etree = _import_lxml_etree()
+    if lxml_etree is None:
+        return ET.fromstring(data)
+
+    if isinstance(data, str):
+        # lxml refuses str input that carries an encoding declaration
+        data = data.encode("utf-8")
+
+    return lxml_etree.fromstring(data, _get_lxml_parser(lxml_etree))
+
+
+def iterparse_xml(source: str | typing.BinaryIO, events: tuple[str, ...] = ("end",)) -> typing.Iterator[
+    tuple[str, ET.Element]
+]:
+    """Like ET.iterparse, backed by lxml if it is installed."""
+
+    lxml_etree = _import_lxml_etree()
+    if lxml_etree is None:
+        return ET.iterparse(source, events=events)
+
+    return lxml_etree.iterparse(source, events=events, remove_comments=True, remove_pis=True)
+
+
+def intern_text(text: str | None) -> str | None:
+    """Teacher, subject and room names repeat throughout a plan, keep one copy of each."""
+    return sys.intern(text) if text else text
+
+
+def index_children(xml: ET.Element) -> dict[str, ET.Element]:
+    """Map the tags of the direct children to the children in one pass. Like find(), the first child wins. Look
+    children up with get(), so that a missing required child fails with an AttributeError as with find()."""
+    children = {}
+    for child in xml:
+        children.setdefault(child.tag, child)
+
+    return children
+
+
+@functools.lru_cache(maxsize=256)
+def parse_time(time_str: str) -> datetime.time:
+    """Parse "%H:%M" without strptime, which is slow. Every plan repeats the same handful of times."""
+    hour, minute = time_str.split(":")
+
+    return datetime.time(int(hour), int(minute))
+
 
 def parse_free_days(xml: ET.Element) -> list[datetime.date]:
     free_days = []
     for day in xml:
+        # "%y%m%d", sliced by hand because strptime is slow
+        text = day.text
         free_days.append(
-            datetime.datetime.strptime(day.text, "%y%m%d").date()
+            datetime.date(2000 + int(text[:2]), int(text[2:4]), int(text[4:6]))
         )
 
     return free_days
 
 
-def parse_plan_date(date: str) -> datetime.date:
+def parse_plan_timestamp(timestamp: str) -> datetime.datetime:
     """
-    Example: Freitag, 23. Juni 2023
+    Example: 23.06.2023, 07:12
     """
 
-    months = {
-        "Januar": 1,
-        "Februar": 2,
-        "März": 3,
-        "April": 4,
-        "Mai": 5,
-        "Juni": 6,
-        "Juli": 7,
-        "August": 8,
-        "September": 9,
-        "Oktober": 10,
-        "November": 11,
-        "Dezember": 12
-    }
+    if len(timestamp) != 17:
+        # not zero-padded, let strptime deal with it
+        return datetime.datetime.strptime(timestamp, "%d.%m.%Y, %H:%M")
+
+    return datetime.datetime(
+        int(timestamp[6:10]), int(timestamp[3:5]), int(timestamp[0:2]), int(timestamp[12:14]), int(timestamp[15:17])
+    )
+
 
-    _, date = date.split(", ", 1)
+_MONTHS = {
+    "Januar": 1,
+    "Februar": 2,
+    "März": 3,
+    "April": 4,
+    "Mai": 5,
+    "Juni": 6,
+    "Juli": 7,
+    "August": 8,
+    "September": 9,
+    "Oktober": 10,
+    "November": 11,
+    "Dezember": 12
+}
 
-    day, month_and_year = date.split(". ", 1)
-    month, _year = month_and_year.split(" ", 1)
 
-    # _year sometimes contains the week. Example: "2023 (A-Woche)"
-    year, *_ = _year.split(" ", 1)
+def parse_plan_date(date: str) -> datetime.date:
+    """
+    Example: Freitag, 23. Juni 2023
+    """
+
+    day_start = date.index(", ") + 2
+    month_start = date.index(". ", day_start) + 2
+    year_start = date.index(" ", month_start) + 1
 
-    return datetime.date(int(year), months[month], int(day))
+    # the year is sometimes followed by the week. Example: "2023 (A-Woche)"
+    year_end = date.find(" ", year_start)
 
+    return datetime.date(
+        int(date[year_start:year_end if year_end != -1 else None]),
+        _MONTHS[date[month_start:year_start - 1]],
+        int(date[day_start:month_start - 2])
+    )
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True, frozen=True)
 class Value:
     content: str | None
     was_changed: bool
@@ -63,6 +162,10 @@ class Value:
         return self.content
 
 
+# the same (name, changed) pairs repeat for every lesson, share one immutable instance per pair
+get_value = functools.lru_cache(maxsize=4096)(Value)
+
+
 class Exam:
     year: int
     course: str
@@ -75,27 +178,29 @@ class Exam:
     @classmethod
     def from_xml_substitution_plan(cls, xml: ET.Element) -> Exam:
         exam = cls()
+        children = index_children(xml)
 
-        exam.year = int(xml.find("jahrgang").text)
-        exam.course = xml.find("kurs").text
-        exam.course_teacher = xml.find("kursleiter").text
-        exam.period = int(xml.find("stunde").text)
-        exam.begin = datetime.datetime.strptime(xml.find("beginn").text, "%H:%M").time()
-        exam.duration = int(xml.find("dauer").text)
-        exam.info = xml.find("kinfo").text
+        exam.year = int(children.get("jahrgang").text)
+        exam.course = children.get("kurs").text
+        exam.course_teacher = children.get("kursleiter").text
+        exam.period = int(children.get("stunde").text)
+        exam.begin = parse_time(children.get("beginn").text)
+        exam.duration = int(children.get("dauer").text)
+        exam.info = children.get("kinfo").text
 
         return exam
 
     @classmethod
     def from_xml_indiware_mobile(cls, xml: ET.Element) -> Exam:
         exam = cls()
-
-        exam.year = int(xml.find(f"KlJahrgang").text)
-        exam.course = xml.find("KlKurs").text
-        exam.course_teacher = xml.find("KlKursleiter").text
-        exam.period = int(xml.find("KlStunde").text)
-        exam.begin = datetime.datetime.strptime(xml.find("KlBeginn").text, "%H:%M").time()
-        exam.duration = int(xml.find("KlDauer").text)
-        exam.info = xml.find("KlKinfo").text
+        children = index_children(xml)
+
+        exam.year = int(children.get("KlJahrgang").text)
+        exam.course = children.get("KlKurs").text
+        exam.course_teacher = children.get("KlKursleiter").text
+        exam.period = int(children.get("KlStunde").text)
+        exam.begin = parse_time(children.get("KlBeginn").text)
+        exam.duration = int(children.get("KlDauer").text)
+        exam.info = children.get("KlKinfo").text
 
         return exam
@@ -2,22 +2,34 @@ from __future__ import annotations
 
 import datetime
 import xml.etree.ElementTree as ET
+import zoneinfo
 
-from .shared import parse_free_days, parse_plan_date, Value, Exam
-
-import pytz
+from .shared import (
+    get_value, index_children, intern_text, parse_free_days, parse_plan_date, parse_plan_timestamp, Value, Exam
+)
 
 __all__ = ["SubstitutionPlan", "Action"]
 
+_BERLIN = zoneinfo.ZoneInfo("Europe/Berlin")
+
+
+def split_text_if_exists(xml: ET.Element | None, tag: str) -> list[str]:
+    if xml is None:
+        return []
 
-def split_text_if_exists(xml: ET.Element, tag: str) -> list[str]:
-    try:
-        return xml.find(tag).text.split(", ")
-    except AttributeError:
+    element = xml.find(tag)
+    if element is None or element.text is None:
         return []
 
+    return element.text.split(", ")
+
 
 class SubstitutionPlan:
+    __slots__ = (
+        "filename", "date", "school_name", "timestamp", "absent_teachers", "absent_forms", "absent_rooms",
+        "changed_teachers", "changed_forms", "free_days", "actions", "exams", "break_supervisions", "additional_info"
+    )
+
     filename: str
     date: datetime.date
     school_name: str
@@ -47,10 +59,7 @@ class SubstitutionPlan:
         plan.filename = head.find("datei").text
         plan.date = parse_plan_date(head.find("titel").text)
         plan.school_name = head.find("schulname").text
-        plan.timestamp = (
-            pytz.timezone("Europe/Berlin")
-            .localize(datetime.datetime.strptime(head.find("datum").text, "%d.%m.%Y, %H:%M"))
-        )
+        plan.timestamp = parse_plan_timestamp(head.find("datum").text).replace(tzinfo=_BERLIN)
 
         head_info = head.find("kopfinfo")
 
@@ -62,29 +71,19 @@ class SubstitutionPlan:
 
         plan.free_days = parse_free_days(xml.find("freietage"))
 
-        plan.actions = []
-        for action in xml.find("haupt") or []:
-            plan.actions.append(Action.from_xml(action))
-
-        plan.exams = []
-        for exam in xml.find("klausuren") or []:
-            plan.exams.append(Exam.from_xml_substitution_plan(exam))
-
-        plan.break_supervisions = []
-        for supervision_row in xml.find("aufsichten") or []:
-            plan.break_supervisions.append(supervision_row.find("aufsichtinfo").text)
-
-        footer = xml.find("fuss")
-        plan.additional_info = []
-
-        if footer is not None:
-            for line in footer.find("fusszeile") or []:
-                plan.additional_info.append(line.text)
+        plan.actions = [Action.from_xml(action) for action in xml.iterfind("haupt/*")]
+        plan.exams = [Exam.from_xml_substitution_plan(exam) for exam in xml.iterfind("klausuren/*")]
+        plan.break_supervisions = [row.find("aufsichtinfo").text for row in xml.iterfind("aufsichten/*")]
+        plan.additional_info = [line.text for line in xml.iterfind("fuss/fusszeile/*")]
 
         return plan
 
 
 class Action:
+    __slots__ = (
+        "form", "period", "subject", "teacher", "room", "original_subject", "original_teacher", "original_room", "info"
+    )
+
     form: str | None
     period: str
 
@@ -101,37 +100,38 @@ class Action:
     @classmethod
     def from_xml(cls, xml: ET.Element) -> Action:
         action = cls()
+        children = index_children(xml)
 
-        action.form = form.text if (form := xml.find("klasse")) is not None else None
-        action.period = xml.find("stunde").text
+        action.form = form.text if (form := children.get("klasse")) is not None else None
+        action.period = children.get("stunde").text
 
-        fach = xml.find("fach")
-        lehrer = xml.find("lehrer")
-        raum = xml.find("raum")
+        fach = children.get("fach")
+        lehrer = children.get("lehrer")
+        raum = children.get("raum")
 
-        vfach = xml.find("vfach")
-        vlehrer = xml.find("vlehrer")
-        vraum = xml.find("vraum")
+        vfach = children.get("vfach")
+        vlehrer = children.get("vlehrer")
+        vraum = children.get("vraum")
 
         if (vfach is not None) or (vlehrer is not None) or (vraum is not None):
             # this is a teachers' substitution plan
-            action.original_subject = fach.text
-            action.original_teacher = lehrer.text
-            action.original_room = raum.text if raum is not None else None
+            action.original_subject = intern_text(fach.text)
+            action.original_teacher = intern_text(lehrer.text)
+            action.original_room = intern_text(raum.text) if raum is not None else None
 
-            action.subject = Value(vfach.text, vfach.get("legeaendert") == "ae")
-            action.teacher = Value(vlehrer.text, vlehrer.get("legeaendert") == "ae")
-            action.room = Value(vraum.text, vraum.get("rageaendert") == "ae")
+            action.subject = get_value(intern_text(vfach.text), vfach.get("legeaendert") == "ae")
+            action.teacher = get_value(intern_text(vlehrer.text), vlehrer.get("legeaendert") == "ae")
+            action.room = get_value(intern_text(vraum.text), vraum.get("rageaendert") == "ae")
         else:
             # in students' substitution plans, the original values are included in the info
             action.original_subject = None
             action.original_teacher = None
             action.original_room = None
 
-            action.subject = Value(fach.text, xml.find("lehrer").get("legeaendert") == "ae")
+            action.subject = get_value(intern_text(fach.text), lehrer.get("legeaendert") == "ae")
             action.teacher = Value(lehrer, lehrer.get("legeaendert") == "ae")
-            action.room = Value(raum.text, raum.get("rageaendert") == "ae")
+            action.room = get_value(intern_text(raum.text), raum.get("rageaendert") == "ae")
 
-        action.info = xml.find("info").text
+        action.info = children.get("info").text
 
         return action
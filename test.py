@@ -1,71 +1,127 @@
 import asyncio
 import datetime
+import itertools
 import json
 from pathlib import Path
-import aiohttp
-import xml.etree.ElementTree as ET
+
+import requests
+import requests.adapters
 
 from stundenplan24_py import *
 
+# past substitution plans requested at once per client
+SUBSTITUTION_PLAN_WINDOW = 10
+
+ONE_DAY = datetime.timedelta(days=1)
+
 
-async def test_hosting(hosting: Hosting, name: str, session: aiohttp.ClientSession):
+async def test_hosting(hosting: Hosting, name: str, session: requests.Session, semaphore: asyncio.Semaphore):
     client = IndiwareStundenplanerClient(hosting, session=session)
 
     path = Path("_schools") / name
-    (path / "vdaten").mkdir(exist_ok=True, parents=True)
-
-    try:
-        for indiware_mobil_client in client.indiware_mobil_clients:
-            available_plans = await indiware_mobil_client.fetch_dates()
 
-            for filename, timestamp in available_plans.items():
-                indiware_mobil_plan = await indiware_mobil_client.fetch_plan(filename)
+    async def fetch_indiware_mobil_plan(indiware_mobil_client: IndiwareMobilClient, filename: str):
+        async with semaphore:
+            indiware_mobil_plan = await indiware_mobil_client.fetch_plan(filename)
 
-                print(f"> Fetched plan {filename!r}. Timestamp: {indiware_mobil_plan.last_modified!s}")
-                with open(path / filename, "w") as f:
-                    f.write(indiware_mobil_plan.content)
+        print(f"> Fetched plan {filename!r}. Timestamp: {indiware_mobil_plan.last_modified!s}")
+        await asyncio.to_thread((path / filename).write_bytes, indiware_mobil_plan.raw_content)
 
-    except Exception as e:
-        raise
+    async def fetch_substitution_plan(substitution_plan_client: SubstitutionPlanClient, date: datetime.date):
+        async with semaphore:
+            return await substitution_plan_client.fetch_plan(date)
 
-    try:
-        for substitution_plan_client in client.substitution_plan_clients:
+    async def fetch_substitution_plans(substitution_plan_client: SubstitutionPlanClient):
+        async with semaphore:
             base_plan = substitution_plan.SubstitutionPlan.from_xml(
-                ET.fromstring((await substitution_plan_client.fetch_plan()).content)
+                parse_xml((await substitution_plan_client.fetch_plan()).raw_content)
             )
-            free_days = base_plan.free_days
+        free_days = frozenset(base_plan.free_days)
+        format_plan_file = substitution_plan_client.endpoint.plan_file_url2.format
 
+        def previous_school_days():
             current_date = base_plan.date
             while True:
-                current_date -= datetime.timedelta(days=1)
+                current_date -= ONE_DAY
                 while current_date in free_days or current_date.weekday() in (5, 6):
-                    current_date -= datetime.timedelta(days=1)
+                    current_date -= ONE_DAY
+
+                yield current_date
+
+        # substitution plans of past school days should have been uploaded, old ones may not be available anymore.
+        # fetch a window of days at once and stop at the first missing plan
+        school_days = previous_school_days()
+        while True:
+            dates = list(itertools.islice(school_days, SUBSTITUTION_PLAN_WINDOW))
+            plans = await asyncio.gather(
+                *(fetch_substitution_plan(substitution_plan_client, date) for date in dates),
+                return_exceptions=True
+            )
 
-                # substitution plan of current_date should have been uploaded, may not be available anymore
-                try:
-                    plan = await substitution_plan_client.fetch_plan(current_date)
-                    print(f"> Fetched substitution plan. Date: {current_date!s}. Timestamp: {plan.last_modified}")
+            fetched = []
+            for date, plan in zip(dates, plans):
+                if isinstance(plan, PlanNotFoundError):
+                    break
+                elif isinstance(plan, BaseException):
+                    raise plan
 
-                    with open(path / substitution_plan_client.endpoint.plan_file_url2.format(date=current_date.strftime("%Y%m%d")), "w") as f:
-                        f.write(plan.content)
+                print(f"> Fetched substitution plan. Date: {date!s}. Timestamp: {plan.last_modified}")
+                fetched.append((date, plan))
 
-                except PlanNotFoundError:
-                    break
-    except Exception as e:
-        raise
+            await asyncio.gather(*(
+                asyncio.to_thread(
+                    (path / format_plan_file(date=f"{date.year:04}{date.month:02}{date.day:02}")).write_bytes,
+                    plan.raw_content
+                )
+                for date, plan in fetched
+            ))
+
+            if len(fetched) < len(dates):
+                break
+
+    async with asyncio.TaskGroup() as task_group:
+        for indiware_mobil_client in client.indiware_mobil_clients:
+            async with semaphore:
+                available_plans = await indiware_mobil_client.fetch_dates()
+
+            for filename in available_plans:
+                task_group.create_task(fetch_indiware_mobil_plan(indiware_mobil_client, filename))
+
+        for substitution_plan_client in client.substitution_plan_clients:
+            task_group.create_task(fetch_substitution_plans(substitution_plan_client))
 
 
 async def main():
     with open("creds.json") as f:
         hostings = {name: Hosting.deserialize(data["hosting"]) for name, data in json.load(f).items()}
 
-    for name, hosting in hostings.items():
-        async with aiohttp.ClientSession() as session:
-            await test_hosting(hosting, name, session)
+    for name in hostings:
+        (Path("_schools") / name / "vdaten").mkdir(exist_ok=True, parents=True)
+
+    # caps the requests in flight across all schools
+    semaphore = asyncio.Semaphore(32)
+
+    # one connection pool for all schools, most of them are hosted on the same server
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        async with asyncio.TaskGroup() as task_group:
+            for name, hosting in hostings.items():
+                task_group.create_task(test_hosting(hosting, name, session, semaphore))
 
             # substitution_plan_students = await client.fetch_substitution_plan_students(date)
             # substitution_plan_teachers = await client.fetch_substitution_plan_teachers(date)
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    try:
+        import uvloop
+    except ImportError:
+        loop_factory = None
+    else:
+        loop_factory = uvloop.new_event_loop
+
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(main())
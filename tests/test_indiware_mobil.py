@@ -0,0 +1,42 @@
+import unittest
+
+from stundenplan24_py import parse_xml
+from stundenplan24_py.indiware_mobil import Lesson
+
+LESSON = """<Std>
+<St>1</St><Beginn>7:30</Beginn><Ende>8:15</Ende>
+<Fa FaAe="FaGeaendert">Ma</Fa><Le>ABC</Le><Ra>101</Ra><Nr>12</Nr><If>statt De</If>
+</Std>"""
+
+LESSON_WITHOUT_PERIOD = """<Std><Fa>Ma</Fa><Le>ABC</Le><Ra>101</Ra><If/></Std>"""
+
+LESSON_WITHOUT_OPTIONAL_CHILDREN = """<Std><St>2</St><Fa>Ma</Fa><Le>ABC</Le><Ra>101</Ra><If/></Std>"""
+
+
+class LessonTest(unittest.TestCase):
+    def test_lesson(self):
+        lesson = Lesson.from_xml(parse_xml(LESSON))
+
+        self.assertEqual(lesson.period, 1)
+        self.assertEqual(lesson.subject.content, "Ma")
+        self.assertTrue(lesson.subject.was_changed)
+        self.assertFalse(lesson.teacher.was_changed)
+        self.assertEqual(lesson.class_number, "12")
+        self.assertEqual(lesson.information, "statt De")
+
+    def test_missing_optional_children(self):
+        lesson = Lesson.from_xml(parse_xml(LESSON_WITHOUT_OPTIONAL_CHILDREN))
+
+        self.assertIsNone(lesson.start)
+        self.assertIsNone(lesson.end)
+        self.assertIsNone(lesson.course2)
+        self.assertIsNone(lesson.class_number)
+        self.assertIsNone(lesson.information)
+
+    def test_missing_required_child(self):
+        with self.assertRaises(AttributeError):
+            Lesson.from_xml(parse_xml(LESSON_WITHOUT_PERIOD))
+
+
+if __name__ == "__main__":
+    unittest.main()
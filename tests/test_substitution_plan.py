@@ -0,0 +1,42 @@
+import datetime
+import unittest
+
+from stundenplan24_py import parse_xml
+from stundenplan24_py.substitution_plan import Action, SubstitutionPlan
+
+PLAN_WITHOUT_HEAD_INFO = """<?xml version="1.0" encoding="utf-8"?>
+<vp>
+<kopf>
+<datei>PlanKl20230623.xml</datei>
+<titel>Freitag, 23. Juni 2023 (A-Woche)</titel>
+<schulname>Schule</schulname>
+<datum>22.06.2023, 14:05</datum>
+</kopf>
+<freietage><ft>230704</ft></freietage>
+<haupt>
+<aktion><klasse>5a</klasse><stunde>1</stunde><fach>Ma</fach><lehrer>ABC</lehrer><raum>101</raum><info/></aktion>
+</haupt>
+</vp>"""
+
+ACTION_WITHOUT_PERIOD = """<aktion><klasse>5a</klasse><fach>Ma</fach><lehrer>ABC</lehrer><raum>101</raum><info/></aktion>"""
+
+
+class SubstitutionPlanTest(unittest.TestCase):
+    def test_plan_without_head_info(self):
+        plan = SubstitutionPlan.from_xml(parse_xml(PLAN_WITHOUT_HEAD_INFO))
+
+        self.assertEqual(plan.date, datetime.date(2023, 6, 23))
+        self.assertEqual(plan.absent_teachers, [])
+        self.assertEqual(plan.absent_forms, [])
+        self.assertEqual(plan.absent_rooms, [])
+        self.assertEqual(plan.changed_teachers, [])
+        self.assertEqual(plan.changed_forms, [])
+        self.assertEqual(len(plan.actions), 1)
+
+    def test_action_missing_required_child(self):
+        with self.assertRaises(AttributeError):
+            Action.from_xml(parse_xml(ACTION_WITHOUT_PERIOD))
+
+
+if __name__ == "__main__":
+    unittest.main()